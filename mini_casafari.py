@@ -4,12 +4,19 @@
 """
 mini_casafari.py — suporta ficheiro de configuração YAML (--config)
 Perfis: podes ter config_light.yml e config_full.yml sem tocar no workflow.
+EMIT_XLSX=0 (variável de ambiente) salta a exportação XLSX; por omissão é gerada.
 """
-import re, sys, math, time, argparse, glob, os, random, collections, datetime, json
-from dataclasses import dataclass, asdict
-from urllib.parse import urljoin, urlencode
+import re, sys, math, time, argparse, os, random, collections, datetime, json, threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, fields
+from urllib.parse import urljoin, urlencode, urlparse
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from lxml import etree
+from lxml.html import HTMLParser, fromstring
+from cssselect import HTMLTranslator
+import numpy as np
 import pandas as pd
 
 try:
@@ -17,10 +24,22 @@ try:
 except Exception as e:
     print("PyYAML é necessário. Instala com: pip install pyyaml", file=sys.stderr)
     raise
+# Loader em C (libyaml) quando disponível; mesmo comportamento do safe_load
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+try:
+    import requests_cache  # opcional: cache HTTP em disco entre ciclos/execuções
+except ImportError:
+    requests_cache = None
+
+try:
+    import pyarrow as pa, pyarrow.compute as pc  # opcional: is_in com hash table em C++
+except ImportError:
+    pa = pc = None
 
 DEFAULT_HEADERS = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36"}
 
-@dataclass
+@dataclass(slots=True)
 class Listing:
     source: str
     title: str
@@ -31,19 +50,63 @@ class Listing:
     details: str
     image_url: str = ""
 
+# HTMLParser por thread e por encoding (os parsers do lxml não devem ser partilhados entre threads)
+_parsers = threading.local()
+_CHARSET = re.compile(rb'charset=["\']?([\w.:-]+)', re.I)
+
+def _encoding(content_type, head):
+    """charset do Content-Type, senão do <meta> no início do documento, senão UTF-8"""
+    m = _CHARSET.search(content_type.encode("latin-1", "ignore")) or _CHARSET.search(head[:2048])
+    return m.group(1).decode("ascii").lower() if m else "utf-8"
+
+def _html_parser(encoding):
+    cache = getattr(_parsers, "by_encoding", None)
+    if cache is None:
+        cache = _parsers.by_encoding = {}
+    parser = cache.get(encoding)
+    if parser is None:
+        try:
+            parser = HTMLParser(encoding=encoding)
+        except LookupError:
+            parser = _html_parser("utf-8") if encoding != "utf-8" else HTMLParser()
+        cache[encoding] = parser
+    return parser
+
+_CSS = HTMLTranslator()
+
+def css(selector):
+    """CSS -> XPath compilado; só descendentes, como o select/select_one do BeautifulSoup"""
+    return etree.XPath(_CSS.css_to_xpath(selector, prefix="descendant::"))
+
+def text_of(el):
+    """Equivalente a get_text(strip=True) do BeautifulSoup; "" se el for None"""
+    if el is None: return ""
+    return "".join(t.strip() for t in el.itertext())
+
+_NONDIGIT = re.compile(r'[^0-9]')
+
 def parse_price_to_float(text: str) -> float:
     if not text: return math.nan
-    nums = re.sub(r'[^0-9]', '', text)
+    nums = _NONDIGIT.sub('', text)
     return float(nums) if nums else math.nan
 
-def any_keyword(text: str, keywords):
-    t = (text or "").lower()
-    return any(k.lower() in t for k in keywords) if keywords else True
+def price_rejected(price, lo, hi):
+    """Fora de [lo, hi]; preço NaN (desconhecido) nunca é rejeitado (price == price é o teste de NaN)"""
+    return price == price and bool((lo and price < lo) or (hi and price > hi))
 
-def locality_match(text: str, localities):
-    if not localities: return True
-    t = (text or "").lower()
-    return any(loc.lower() in t for loc in localities)
+def compile_terms(terms):
+    """Uma só alternação (em minúsculas) para todos os termos; None se a lista estiver vazia"""
+    terms = [t.lower() for t in terms if t]
+    if not terms: return None
+    return re.compile("|".join(map(re.escape, terms)))
+
+def text_filters_ok(title, location, details, localities_re, keywords_re):
+    """Localidade (título+local) e keywords (título+detalhes), com o título em minúsculas uma só vez"""
+    if localities_re is None and keywords_re is None: return True
+    title_lc = title.lower()
+    if localities_re is not None and not localities_re.search(title_lc + " " + location.lower()): return False
+    if keywords_re is not None and not keywords_re.search(title_lc + " " + details.lower()): return False
+    return True
 
 def read_localities(localities_list, localities_file):
     out = []
@@ -73,319 +136,384 @@ def parse_per_source_limit_map(m):
         return out
     return {}
 
-def http_get(session, url, timeout=25, retries=3, backoff_base=0.8):
-    """GET with simple retry + exponential backoff + jitter"""
-    last = None
-    for attempt in range(1, retries+1):
+# Pedidos em paralelo, mas no máximo PER_HOST_CONCURRENCY por portal (cortesia)
+PER_HOST_CONCURRENCY = 2
+IMAGE_WORKERS = 8
+_host_slots = {}
+_host_slots_lock = threading.Lock()
+
+def host_slot(url):
+    host = urlparse(url).netloc
+    with _host_slots_lock:
+        slot = _host_slots.get(host)
+        if slot is None:
+            slot = _host_slots[host] = threading.BoundedSemaphore(PER_HOST_CONCURRENCY)
+    return slot
+
+HTTP_CACHE_EXPIRE = 6 * 3600  # segundos; só quando o site não manda Cache-Control
+
+def make_session(retries=3, backoff_base=0.8, cache_dir=None):
+    """Sessão com keep-alive + pool de ligações + retry/backoff do urllib3.
+    Com cache_dir (e requests-cache instalado) os GET ficam em cache sqlite nessa pasta;
+    só para as páginas de detalhe (og:image) — as de pesquisa não podem ficar em cache,
+    senão um captcha servido com 200 era reaproveitado nos ciclos/execuções seguintes."""
+    retry = Retry(total=retries, backoff_factor=backoff_base,
+                  status_forcelist=[429, 500, 502, 503, 504],
+                  allowed_methods=frozenset(["GET"]), raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=16, pool_maxsize=32, max_retries=retry)
+    if cache_dir and requests_cache is not None:
+        s = requests_cache.CachedSession(
+            cache_name=os.path.join(cache_dir, ".http_cache"), backend="sqlite",
+            expire_after=HTTP_CACHE_EXPIRE, cache_control=True, allowable_methods=("GET",))
+    else:
+        s = requests.Session()
+    s.headers.update(DEFAULT_HEADERS)
+    s.mount("http://", adapter)
+    s.mount("https://", adapter)
+    return s
+
+CHUNK_SIZE = 65536
+_BLOCK_MARKERS = (b"captcha", b"are you a robot", b"complete the security check")
+_MARKER_TAIL = max(map(len, _BLOCK_MARKERS)) - 1
+
+def fetch_page(session, url, timeout=25, check_block=True):
+    """GET em streaming com parse incremental (feed do lxml) à medida que o corpo chega.
+    A sobreposição download/parse só acontece com requests.Session (pesquisas); a CachedSession
+    lê o corpo todo antes do primeiro chunk.
+    Devolve a raiz do documento, ou None se o estado não for 200 ou (com check_block) a página
+    for um bloqueio/captcha."""
+    with host_slot(url):
+        r = session.get(url, timeout=timeout, allow_redirects=True, stream=True)
+        parser = None
         try:
-            r = session.get(url, timeout=timeout, allow_redirects=True)
-            if r.status_code >= 200 and r.status_code < 400 and r.text:
-                return r
-            last = r
-        except Exception as e:
-            last = e
-        sleep = backoff_base * (2 ** (attempt-1)) + random.uniform(0, 0.3)
-        time.sleep(sleep)
-    if isinstance(last, requests.Response):
-        return last
-    raise RuntimeError(f"GET failed after {retries} attempts: {url} ({last})")
-
-def is_block_signal(response_text: str, status_code: int):
-    if status_code in (403, 429):
-        return True
-    t = (response_text or "").lower()
-    if "captcha" in t or "are you a robot" in t or "complete the security check" in t:
-        return True
-    return False
-
-def try_get_image(url: str, session, timeout, retries):
+            if r.status_code != 200:
+                return None
+            tail, head = b"", b""
+            for chunk in r.iter_content(CHUNK_SIZE):
+                if not chunk: continue
+                if check_block:
+                    window = tail + chunk.lower()
+                    if any(m in window for m in _BLOCK_MARKERS):
+                        return None
+                    tail = window[-_MARKER_TAIL:]
+                if parser is None:
+                    # o encoding decide-se com os primeiros 2 KB (onde está o <meta charset>)
+                    head += chunk
+                    if len(head) < 2048: continue
+                    parser = _html_parser(_encoding(r.headers.get("content-type", ""), head))
+                    chunk = head
+                parser.feed(chunk)
+            if parser is None:
+                if not head:
+                    return fromstring(b"<html></html>")
+                parser = _html_parser(_encoding(r.headers.get("content-type", ""), head))
+                parser.feed(head)
+            root, parser = parser.close(), None
+            return root
+        finally:
+            if parser is not None:
+                try: parser.close()  # repõe o parser (reutilizado pela thread) após abortar a meio
+                except Exception: pass
+            r.close()
+
+def try_get_image(url: str, session, timeout):
     if not url: return ""
     try:
-        r = http_get(session, url, timeout=timeout, retries=retries)
-        if r.status_code != 200:
+        # páginas de detalhe trazem reCAPTCHA nos formulários de contacto: não é bloqueio
+        root = fetch_page(session, url, timeout=timeout, check_block=False)
+        if root is None:
             return ""
-        from bs4 import BeautifulSoup
-        soup = BeautifulSoup(r.text, "html.parser")
-        og = soup.find("meta", property="og:image") or soup.find("meta", attrs={"name":"og:image"})
-        if og and og.get("content"): return og["content"]
-        img = soup.find("img")
-        if img and img.get("src"):
-            src = img["src"]
+        og = root.xpath('//meta[@property="og:image"]/@content') or root.xpath('//meta[@name="og:image"]/@content')
+        if og and og[0]: return og[0]
+        img = root.find(".//img")
+        if img is not None and img.get("src"):
+            src = img.get("src")
             if src.startswith("//"): src = "https:" + src
             if src.startswith("http"): return src
     except Exception:
         return ""
     return ""
 
+_IMG = css("img")
+
+def card_image(card, base):
+    """Miniatura que já vem no cartão da listagem (src ou lazy-load data-src)"""
+    img = first(card, (_IMG,))
+    if img is None: return ""
+    for attr in ("src", "data-src"):
+        src = img.get(attr) or ""
+        if src.startswith("//"): src = "https:" + src
+        elif src.startswith("/"): src = urljoin(base, src)
+        if src.startswith("http"): return src
+    return ""
+
+class SeenUrls:
+    """URLs já recolhidos nesta execução, partilhado pelas threads dos scrapers (dedup online)"""
+    def __init__(self):
+        self._urls = set()
+        self._lock = threading.Lock()
+
+    def add(self, url):
+        """True se o URL é novo (e fica registado); URL vazio conta como já visto"""
+        key = (url or "").strip()
+        if not key: return False
+        with self._lock:
+            if key in self._urls: return False
+            self._urls.add(key)
+            return True
+
+def fill_images(items, session, timeout):
+    """Fallback og:image, em paralelo, só para os itens ainda sem imagem (o limite por host fica no fetch_page)"""
+    todo = [it for it in items if it.url and not it.image_url]
+    if not todo: return items
+    with ThreadPoolExecutor(max_workers=min(IMAGE_WORKERS, len(todo))) as ex:
+        imgs = ex.map(lambda it: try_get_image(it.url, session, timeout), todo)
+        for it, img in zip(todo, imgs):
+            it.image_url = img
+    return items
+
+def _compile_selectors(spec):
+    return {k: tuple(css(x) for x in v) for k, v in spec.items()}
+
+def first(el, matchers):
+    """Primeiro elemento que casa com algum dos seletores (pela ordem dada)"""
+    for m in matchers:
+        hits = m(el)
+        if hits: return hits[0]
+    return None
+
+def select_all(el, matchers):
+    for m in matchers:
+        hits = m(el)
+        if hits: return hits
+    return []
+
 # ---- Scrapers (best‑effort; podem precisar de ajuste nos seletores) ----
-def scrape_idealista(max_price, min_price, min_bedrooms, localities, keywords_any, limit, timeout, retries):
+# Seletores compilados uma vez (CSS -> XPath), por portal e por campo, com fallbacks por ordem
+SELECTORS = {k: _compile_selectors(v) for k, v in {
+    "idealista": {
+        "cards": (".item-info-container", "article.item"),
+        "link": (".item-link", "a"),
+        "price": (".item-price", ".price"),
+        "location": (".item-location", ".item-detail-location"),
+        "details": (".item-description", ".item_detail"),
+    },
+    "imovirtual": {
+        "cards": ("article[data-cy='listing-item']", "article"),
+        "link": ("a",),
+        "title": ("[data-cy='listing-title']", "h2", "a"),
+        "price": ("[data-cy='listing-price']", ".price"),
+        "location": ("[data-cy='listing-location']", ".location"),
+        "details": ("[data-cy='listing-description']", "p"),
+    },
+    "casasapo": {
+        "cards": ("div.ListItem", "div.SearchResultProperty"),
+        "link": ("a",),
+        "price": (".Price", ".price"),
+        "location": (".LocationName", ".Location"),
+        "details": (".Description", "p"),
+    },
+    "olx": {
+        "cards": ("div.css-1sw7q4x", "div.css-1apmciz"),
+        "link": ("a",),
+        "price": ("p[data-testid='ad-price']", "h6"),
+        "location": ("p[data-testid='location-date']", "p"),
+    },
+    "trovit": {
+        "cards": ("div.item-info", "div.item"),
+        "link": ("a",),
+        "price": (".price", ".item-price"),
+        "location": (".city", ".specs"),
+        "details": ("p", ".description"),
+    },
+    "remax": {
+        "cards": ("div.property", "div.card", "article"),
+        "link": ("a",),
+        "price": (".property-price", ".price"),
+        "location": (".property-location", ".location"),
+        "details": (".property-description", "p"),
+    },
+    "era": {
+        "cards": ("div.property", "div.card", "article"),
+        "link": ("a",),
+        "price": (".price", ".property-price"),
+        "location": (".property-location", ".location"),
+        "details": (".property-description", "p"),
+    },
+    "century21": {
+        "cards": ("div.property", "div.card", "article"),
+        "link": ("a",),
+        "price": (".price", ".property-price"),
+        "location": (".property-location", ".location"),
+        "details": (".property-description", "p"),
+    },
+}.items()}
+
+def make_extractor(source, base, sel, min_price, max_price, localities_re, keywords_re, seen):
+    """Extrator especializado por portal: seletores, base e filtros ficam presos na closure,
+    e cada cartão é rejeitado o mais cedo possível (URL repetido, depois preço, depois texto)."""
+    link_sel, price_sel = sel["link"], sel["price"]
+    title_sel = sel.get("title")
+    location_sel, details_sel = sel.get("location", ()), sel.get("details", ())
+    def extract(card):
+        a = first(card, link_sel)
+        href = a.get("href") if a is not None else None
+        url_full = urljoin(base, href) if href else ""
+        if not seen.add(url_full): return None
+        price = parse_price_to_float(text_of(first(card, price_sel)))
+        if price_rejected(price, min_price, max_price): return None
+        title = text_of(first(card, title_sel) if title_sel else a)
+        location = text_of(first(card, location_sel))
+        details = text_of(first(card, details_sel))
+        if not text_filters_ok(title, location, details, localities_re, keywords_re): return None
+        return Listing(source, title, price, url_full, location, "", details, card_image(card, base))
+    return extract
+
+def scrape_idealista(max_price, min_price, min_bedrooms, localities, keywords_any, limit, timeout, session, seen):
     items = []
+    sel = SELECTORS["idealista"]
     base_url = "https://www.idealista.pt"
+    extract = make_extractor("idealista", base_url, sel, min_price, max_price, localities, keywords_any, seen)
     path = "/comprar-casas/covilha/"
     if max_price: path += f"com-preco-max_{int(max_price)}/"
     path += "tipo-moradia/"
     if min_bedrooms and min_bedrooms >= 2: path += f"t{int(min_bedrooms)}/"
     url = urljoin(base_url, path)
-    s = requests.Session(); s.headers.update(DEFAULT_HEADERS)
     collected, page = 0, 1
     while collected < limit and page <= 5:
         pg_url = url if page == 1 else urljoin(url, f"pag-{page}.htm")
-        r = http_get(s, pg_url, timeout=timeout, retries=retries)
-        if r.status_code != 200 or is_block_signal(r.text, r.status_code): break
-        soup = BeautifulSoup(r.text, "html.parser")
-        cards = soup.select(".item-info-container") or soup.select("article.item")
+        root = fetch_page(session, pg_url, timeout=timeout)
+        if root is None: break
+        cards = select_all(root, sel["cards"])
         if not cards: break
         for card in cards:
-            title_el = card.select_one(".item-link") or card.select_one("a")
-            price_el = card.select_one(".item-price") or card.select_one(".price")
-            loc_el = card.select_one(".item-location") or card.select_one(".item-detail-location")
-            desc_el = card.select_one(".item-description") or card.select_one(".item_detail")
-            url_path = title_el.get("href") if title_el else None
-            url_full = urljoin(base_url, url_path) if url_path else ""
-            title = (title_el.get_text(strip=True) if title_el else "") or ""
-            price_txt = price_el.get_text(strip=True) if price_el else ""
-            price = parse_price_to_float(price_txt)
-            location = (loc_el.get_text(strip=True) if loc_el else "") or ""
-            details = (desc_el.get_text(strip=True) if desc_el else "") or ""
-            if not math.isnan(price):
-                if min_price and price < min_price: continue
-                if max_price and price > max_price: continue
-            if not locality_match(f"{title} {location}", localities): continue
-            if keywords_any and not any_keyword(f"{title} {details}", keywords_any): continue
-            img = try_get_image(url_full, s, timeout, retries)
-            items.append(Listing("idealista", title, price, url_full, location, "", details, img))
+            it = extract(card)
+            if it is None: continue
+            items.append(it)
             collected += 1
             if collected >= limit: break
         page += 1
     return items
 
-def scrape_imovirtual(max_price, min_price, min_bedrooms, localities, keywords_any, limit, timeout, retries):
+def scrape_imovirtual(max_price, min_price, min_bedrooms, localities, keywords_any, limit, timeout, session, seen):
     items = []
+    sel = SELECTORS["imovirtual"]
     base = "https://www.imovirtual.com/pt/"
-    search_url = base + "comprar/moradia/covilha/?"
-    qs = {"price_to": int(max_price) if max_price else "", "roomsNumber_from": int(min_bedrooms) if min_bedrooms else "", "page": 1}
-    s = requests.Session(); s.headers.update(DEFAULT_HEADERS)
-    while len(items) < limit and qs["page"] <= 5:
-        r = http_get(s, search_url + urlencode(qs), timeout=timeout, retries=retries)
-        if r.status_code != 200 or is_block_signal(r.text, r.status_code): break
-        soup = BeautifulSoup(r.text, "html.parser")
-        cards = soup.select("article[data-cy='listing-item']") or soup.select("article")
+    extract = make_extractor("imovirtual", base, sel, min_price, max_price, localities, keywords_any, seen)
+    qs = {"price_to": int(max_price) if max_price else "", "roomsNumber_from": int(min_bedrooms) if min_bedrooms else ""}
+    search_url = base + "comprar/moradia/covilha/?" + urlencode(qs) + "&page="
+    page = 1
+    while len(items) < limit and page <= 5:
+        root = fetch_page(session, f"{search_url}{page}", timeout=timeout)
+        if root is None: break
+        cards = select_all(root, sel["cards"])
         if not cards: break
         for c in cards:
-            a = c.select_one("a"); url_full = urljoin(base, a.get("href")) if a else ""
-            title_el = c.select_one("[data-cy='listing-title']") or c.select_one("h2") or a
-            title = title_el.get_text(strip=True) if title_el else ""
-            price_el = c.select_one("[data-cy='listing-price']") or c.select_one(".price")
-            price = parse_price_to_float(price_el.get_text(strip=True) if price_el else "")
-            location_el = c.select_one("[data-cy='listing-location']") or c.select_one(".location")
-            location = location_el.get_text(strip=True) if location_el else ""
-            detail_el = c.select_one("[data-cy='listing-description']") or c.select_one("p")
-            details = detail_el.get_text(strip=True) if detail_el else ""
-            if not math.isnan(price):
-                if min_price and price < min_price: continue
-                if max_price and price > max_price: continue
-            if not locality_match(f"{title} {location}", localities): continue
-            if keywords_any and not any_keyword(f"{title} {details}", keywords_any): continue
-            img = try_get_image(url_full, s, timeout, retries)
-            items.append(Listing("imovirtual", title, price, url_full, location, "", details, img))
+            it = extract(c)
+            if it is None: continue
+            items.append(it)
             if len(items) >= limit: break
-        qs["page"] += 1
+        page += 1
     return items
 
-def scrape_casasapo(max_price, min_price, min_bedrooms, localities, keywords_any, limit, timeout, retries):
+def scrape_casasapo(max_price, min_price, min_bedrooms, localities, keywords_any, limit, timeout, session, seen):
     items = []
+    sel = SELECTORS["casasapo"]
     base = "https://www.casa.sapo.pt"
-    search_url = f"{base}/Casas-para-Venda/?"
-    qs = {"site": "1","q": "Covilhã","tt": "1","or": "1","pvmax": int(max_price) if max_price else "","pn": 1}
-    s = requests.Session(); s.headers.update(DEFAULT_HEADERS)
-    while len(items) < limit and qs["pn"] <= 5:
-        r = http_get(s, search_url + urlencode(qs), timeout=timeout, retries=retries)
-        if r.status_code != 200 or is_block_signal(r.text, r.status_code): break
-        soup = BeautifulSoup(r.text, "html.parser")
-        cards = soup.select("div.ListItem") or soup.select("div.SearchResultProperty")
+    extract = make_extractor("casasapo", base, sel, min_price, max_price, localities, keywords_any, seen)
+    qs = {"site": "1","q": "Covilhã","tt": "1","or": "1","pvmax": int(max_price) if max_price else ""}
+    search_url = f"{base}/Casas-para-Venda/?" + urlencode(qs) + "&pn="
+    page = 1
+    while len(items) < limit and page <= 5:
+        root = fetch_page(session, f"{search_url}{page}", timeout=timeout)
+        if root is None: break
+        cards = select_all(root, sel["cards"])
         if not cards: break
         for c in cards:
-            a = c.select_one("a"); url_full = urljoin(base, a.get("href")) if a else ""
-            title = a.get_text(strip=True) if a else ""
-            price_el = c.select_one(".Price") or c.select_one(".price")
-            price = parse_price_to_float(price_el.get_text(strip=True) if price_el else "")
-            location_el = c.select_one(".LocationName") or c.select_one(".Location")
-            location = location_el.get_text(strip=True) if location_el else ""
-            details_el = c.select_one(".Description") or c.select_one("p")
-            details = details_el.get_text(strip=True) if details_el else ""
-            if not math.isnan(price):
-                if min_price and price < min_price: continue
-                if max_price and price > max_price: continue
-            if not locality_match(f"{title} {location}", localities): continue
-            if keywords_any and not any_keyword(f"{title} {details}", keywords_any): continue
-            img = try_get_image(url_full, s, timeout, retries)
-            items.append(Listing("casasapo", title, price, url_full, location, "", details, img))
+            it = extract(c)
+            if it is None: continue
+            items.append(it)
             if len(items) >= limit: break
-        qs["pn"] += 1
+        page += 1
     return items
 
-def scrape_olx(max_price, min_price, min_bedrooms, localities, keywords_any, limit, timeout, retries):
+def scrape_olx(max_price, min_price, min_bedrooms, localities, keywords_any, limit, timeout, session, seen):
     items = []
+    sel = SELECTORS["olx"]
     base = "https://www.olx.pt"
-    search_url = base + "/imoveis/casas-venda/covilha/?"
-    qs = {"search%5Bfilter_float_price%3Ato%5D": int(max_price) if max_price else "", "page": 1}
-    s = requests.Session(); s.headers.update(DEFAULT_HEADERS)
-    while len(items) < limit and qs["page"] <= 5:
-        r = http_get(s, search_url + urlencode(qs), timeout=timeout, retries=retries)
-        if r.status_code != 200 or is_block_signal(r.text, r.status_code): break
-        soup = BeautifulSoup(r.text, "html.parser")
-        cards = soup.select("div.css-1sw7q4x") or soup.select("div.css-1apmciz")
+    extract = make_extractor("olx", base, sel, min_price, max_price, localities, keywords_any, seen)
+    qs = {"search%5Bfilter_float_price%3Ato%5D": int(max_price) if max_price else ""}
+    search_url = base + "/imoveis/casas-venda/covilha/?" + urlencode(qs) + "&page="
+    page = 1
+    while len(items) < limit and page <= 5:
+        root = fetch_page(session, f"{search_url}{page}", timeout=timeout)
+        if root is None: break
+        cards = select_all(root, sel["cards"])
         if not cards: break
         for c in cards:
-            a = c.select_one("a"); url_full = urljoin(base, a.get("href")) if a else ""
-            title = a.get_text(strip=True) if a else ""
-            price_el = c.select_one("p[data-testid='ad-price']") or c.select_one("h6")
-            price = parse_price_to_float(price_el.get_text(strip=True) if price_el else "")
-            location_el = c.select_one("p[data-testid='location-date']") or c.select_one("p")
-            location = location_el.get_text(strip=True) if location_el else ""
-            details = ""
-            if not math.isnan(price):
-                if min_price and price < min_price: continue
-                if max_price and price > max_price: continue
-            if not locality_match(f"{title} {location}", localities): continue
-            if keywords_any and not any_keyword(f"{title} {details}", keywords_any): continue
-            img = try_get_image(url_full, s, timeout, retries)
-            items.append(Listing("olx", title, price, url_full, location, "", details, img))
+            it = extract(c)
+            if it is None: continue
+            items.append(it)
             if len(items) >= limit: break
-        qs["page"] += 1
+        page += 1
     return items
 
-def scrape_trovit(max_price, min_price, min_bedrooms, localities, keywords_any, limit, timeout, retries):
+def scrape_trovit(max_price, min_price, min_bedrooms, localities, keywords_any, limit, timeout, session, seen):
     items = []
+    sel = SELECTORS["trovit"]
     base = "https://casa.trovit.pt"
+    extract = make_extractor("trovit", base, sel, min_price, max_price, localities, keywords_any, seen)
     search_url = base + "/index.php/cod.search_homes/type.1/what_d.covilha/price.max_{}/rooms.min_{}/".format(
         int(max_price) if max_price else 60000, int(min_bedrooms) if min_bedrooms else 2
     )
-    s = requests.Session(); s.headers.update(DEFAULT_HEADERS)
     collected, page = 0, 1
     while collected < limit and page <= 3:
         url = search_url + f"start.{(page-1)*25}"
-        r = http_get(s, url, timeout=timeout, retries=retries)
-        if r.status_code != 200 or is_block_signal(r.text, r.status_code): break
-        soup = BeautifulSoup(r.text, "html.parser")
-        cards = soup.select("div.item-info") or soup.select("div.item")
+        root = fetch_page(session, url, timeout=timeout)
+        if root is None: break
+        cards = select_all(root, sel["cards"])
         if not cards: break
         for c in cards:
-            a = c.select_one("a"); url_full = urljoin(base, a.get("href")) if a else ""
-            title = a.get_text(strip=True) if a else ""
-            price_el = c.select_one(".price") or c.select_one(".item-price")
-            price = parse_price_to_float(price_el.get_text(strip=True) if price_el else "")
-            location_el = c.select_one(".city") or c.select_one(".specs")
-            location = location_el.get_text(strip=True) if location_el else ""
-            details_el = c.select_one("p") or c.select_one(".description")
-            details = details_el.get_text(strip=True) if details_el else ""
-            if not math.isnan(price):
-                if min_price and price < min_price: continue
-                if max_price and price > max_price: continue
-            if not locality_match(f"{title} {location}", localities): continue
-            if keywords_any and not any_keyword(f"{title} {details}", keywords_any): continue
-            img = try_get_image(url_full, s, timeout, retries)
-            items.append(Listing("trovit", title, price, url_full, location, "", details, img))
+            it = extract(c)
+            if it is None: continue
+            items.append(it)
             collected += 1
             if collected >= limit: break
         page += 1
     return items
 
-def scrape_remax(max_price, min_price, min_bedrooms, localities, keywords_any, limit, timeout, retries):
+def _scrape_single_page(source, base, search_url, min_price, max_price, localities, keywords_any, limit, timeout, session, seen):
+    """remax/era/century21: uma só página de resultados, no máximo `limit` cartões"""
     items = []
-    base = "https://www.remax.pt"
-    search_url = f"{base}/comprar?search=covilha&maxprice={int(max_price) if max_price else ''}"
-    s = requests.Session(); s.headers.update(DEFAULT_HEADERS)
+    sel = SELECTORS[source]
+    extract = make_extractor(source, base, sel, min_price, max_price, localities, keywords_any, seen)
     try:
-        r = http_get(s, search_url, timeout=timeout, retries=retries)
-        if r.status_code != 200 or is_block_signal(r.text, r.status_code):
+        root = fetch_page(session, search_url, timeout=timeout)
+        if root is None:
             return items
-        soup = BeautifulSoup(r.text, "html.parser")
-        cards = soup.select("div.property") or soup.select("div.card") or soup.select("article")
+        cards = select_all(root, sel["cards"])
         for c in cards[:limit]:
-            a = c.select_one("a")
-            url_full = urljoin(base, a.get("href")) if a else ""
-            title = a.get_text(strip=True) if a else "Imóvel Remax"
-            price_el = c.select_one(".property-price") or c.select_one(".price")
-            price = parse_price_to_float(price_el.get_text(strip=True) if price_el else "")
-            loc_el = c.select_one(".property-location") or c.select_one(".location")
-            location = loc_el.get_text(strip=True) if loc_el else ""
-            det_el = c.select_one(".property-description") or c.select_one("p")
-            details = det_el.get_text(strip=True) if det_el else ""
-            if not math.isnan(price):
-                if min_price and price < min_price: continue
-                if max_price and price > max_price: continue
-            if not locality_match(f"{title} {location}", localities): continue
-            if keywords_any and not any_keyword(f"{title} {details}", keywords_any): continue
-            img = try_get_image(url_full, s, timeout, retries)
-            items.append(Listing("remax", title, price, url_full, location, "", details, img))
+            it = extract(c)
+            if it is not None:
+                items.append(it)
     except Exception as e:
-        print(f"[WARN] remax failed: {e}", file=sys.stderr)
+        print(f"[WARN] {source} failed: {e}", file=sys.stderr)
     return items
 
-def scrape_era(max_price, min_price, min_bedrooms, localities, keywords_any, limit, timeout, retries):
-    items = []
+def scrape_remax(max_price, min_price, min_bedrooms, localities, keywords_any, limit, timeout, session, seen):
+    base = "https://www.remax.pt"
+    search_url = f"{base}/comprar?search=covilha&maxprice={int(max_price) if max_price else ''}"
+    return _scrape_single_page("remax", base, search_url, min_price, max_price, localities, keywords_any, limit, timeout, session, seen)
+
+def scrape_era(max_price, min_price, min_bedrooms, localities, keywords_any, limit, timeout, session, seen):
     base = "https://www.era.pt"
     search_url = f"{base}/comprar?location=covilha&priceTo={int(max_price) if max_price else ''}"
-    s = requests.Session(); s.headers.update(DEFAULT_HEADERS)
-    try:
-        r = http_get(s, search_url, timeout=timeout, retries=retries)
-        if r.status_code != 200 or is_block_signal(r.text, r.status_code):
-            return items
-        soup = BeautifulSoup(r.text, "html.parser")
-        cards = soup.select("div.property") or soup.select("div.card") or soup.select("article")
-        for c in cards[:limit]:
-            a = c.select_one("a")
-            url_full = urljoin(base, a.get("href")) if a else ""
-            title = a.get_text(strip=True) if a else "Imóvel ERA"
-            price_el = c.select_one(".price") or c.select_one(".property-price")
-            price = parse_price_to_float(price_el.get_text(strip=True) if price_el else "")
-            loc_el = c.select_one(".property-location") or c.select_one(".location")
-            location = loc_el.get_text(strip=True) if loc_el else ""
-            det_el = c.select_one(".property-description") or c.select_one("p")
-            details = det_el.get_text(strip=True) if det_el else ""
-            if not math.isnan(price):
-                if min_price and price < min_price: continue
-                if max_price and price > max_price: continue
-            if not locality_match(f"{title} {location}", localities): continue
-            if keywords_any and not any_keyword(f"{title} {details}", keywords_any): continue
-            img = try_get_image(url_full, s, timeout, retries)
-            items.append(Listing("era", title, price, url_full, location, "", details, img))
-    except Exception as e:
-        print(f"[WARN] era failed: {e}", file=sys.stderr)
-    return items
+    return _scrape_single_page("era", base, search_url, min_price, max_price, localities, keywords_any, limit, timeout, session, seen)
 
-def scrape_century21(max_price, min_price, min_bedrooms, localities, keywords_any, limit, timeout, retries):
-    items = []
+def scrape_century21(max_price, min_price, min_bedrooms, localities, keywords_any, limit, timeout, session, seen):
     base = "https://www.century21.pt"
     search_url = f"{base}/comprar?search=covilha&maxPrice={int(max_price) if max_price else ''}"
-    s = requests.Session(); s.headers.update(DEFAULT_HEADERS)
-    try:
-        r = http_get(s, search_url, timeout=timeout, retries=retries)
-        if r.status_code != 200 or is_block_signal(r.text, r.status_code):
-            return items
-        soup = BeautifulSoup(r.text, "html.parser")
-        cards = soup.select("div.property") or soup.select("div.card") or soup.select("article")
-        for c in cards[:limit]:
-            a = c.select_one("a")
-            url_full = urljoin(base, a.get("href")) if a else ""
-            title = a.get_text(strip=True) if a else "Imóvel Century21"
-            price_el = c.select_one(".price") or c.select_one(".property-price")
-            price = parse_price_to_float(price_el.get_text(strip=True) if price_el else "")
-            loc_el = c.select_one(".property-location") or c.select_one(".location")
-            location = loc_el.get_text(strip=True) if loc_el else ""
-            det_el = c.select_one(".property-description") or c.select_one("p")
-            details = det_el.get_text(strip=True) if det_el else ""
-            if not math.isnan(price):
-                if min_price and price < min_price: continue
-                if max_price and price > max_price: continue
-            if not locality_match(f"{title} {location}", localities): continue
-            if keywords_any and not any_keyword(f"{title} {details}", keywords_any): continue
-            img = try_get_image(url_full, s, timeout, retries)
-            items.append(Listing("century21", title, price, url_full, location, "", details, img))
-    except Exception as e:
-        print(f"[WARN] century21 failed: {e}", file=sys.stderr)
-    return items
+    return _scrape_single_page("century21", base, search_url, min_price, max_price, localities, keywords_any, limit, timeout, session, seen)
 
 SCRAPERS = {
     "idealista": scrape_idealista,
@@ -398,8 +526,27 @@ SCRAPERS = {
     "trovit": scrape_trovit,
 }
 
-def write_html(df, out_html_path, title="Imóveis ≤ 60k — Covilhã & Serra da Estrela"):
-    table_html = df.to_html(index=False, classes="dataframe", escape=False)
+def write_text(path, data):
+    # Codifica uma vez e escreve os bytes numa única chamada
+    with open(path, "wb", buffering=1 << 20) as f:
+        f.write(data.encode("utf-8"))
+
+def _html_table(df):
+    """<table class="dataframe"> como o to_html(escape=False), com as linhas montadas por concatenação vetorizada."""
+    head = "".join(f"      <th>{c}</th>\n" for c in df.columns)
+    if df.empty:
+        body = ""
+    else:
+        row = "    <tr>\n"
+        for c in df.columns:
+            s = df[c]
+            row = row + "      <td>" + s.astype(str).mask(s.isna(), "NaN").to_numpy(dtype=object) + "</td>\n"
+        body = pd.Series(row + "    </tr>\n").str.cat()
+    return ('<table border="1" class="dataframe">\n  <thead>\n    <tr style="text-align: right;">\n'
+            f"{head}    </tr>\n  </thead>\n  <tbody>\n{body}  </tbody>\n</table>")
+
+def render_html(df, title="Imóveis ≤ 60k — Covilhã & Serra da Estrela"):
+    table_html = _html_table(df)
     html = f"""<!doctype html><html lang="pt"><head>
 <meta charset="utf-8"><meta name="viewport" content="width=device-width, initial-scale=1">
 <title>{title}</title>
@@ -432,16 +579,87 @@ function sortTable(table, col, reverse) {{
 (function(){{var t=document.getElementsByClassName('dataframe');if(!t.length)return;var table=t[0];var ths=table.tHead?table.tHead.rows[0].cells:[];for(let i=0;i<ths.length;i++){{ths[i].addEventListener('click',function(){{var asc=this.getAttribute('data-asc')!=='true';sortTable(table,i,!asc);this.setAttribute('data-asc',asc?'true':'false');}});}}}})();
 </script>
 </body></html>"""
+    return html
+
+def write_html(df, out_html_path, title="Imóveis ≤ 60k — Covilhã & Serra da Estrela"):
     os.makedirs(os.path.dirname(out_html_path), exist_ok=True)
-    with open(out_html_path, "w", encoding="utf-8") as f:
-        f.write(html)
+    write_text(out_html_path, render_html(df, title))
+
+def price_deltas(cur, prev, eps=1e-6):
+    """Delta de preço e direção (1 sobe, -1 desce, 0 igual/sem anterior) por linha."""
+    delta = np.subtract(cur, prev, dtype=np.float64)  # NaN onde não há preço anterior
+    direction = (delta > eps).astype(np.int8) - (delta < -eps).astype(np.int8)
+    return direction, delta
+
+# Badges de variação de preço, pré-formatados
+_UP = '<span class="badge up">↑ '
+_DOWN = '<span class="badge down">↓ '
+_SUF = '€</span>'
+
+def decorate_rows(direction, delta, url, img, title):
+    """Badge de preço, título com link e tag da foto numa só passagem sobre as mesmas colunas.
+    url/img/title são Series de string sem nulos; direction None (primeira execução): sem badges."""
+    if direction is None:
+        price_change = ""
+    else:
+        changed = direction != 0
+        badge = np.char.add(np.where(direction > 0, _UP, _DOWN),
+                            np.char.add(np.char.mod("%+.0f", np.where(changed, delta, 0.0)), _SUF))
+        price_change = np.where(changed, badge.astype(object), "")
+    # where/mask com máscara booleana: sem ramos por linha e sem upcast para object
+    title_html = title.mask(url.ne(""), '<a href="' + url + '" target="_blank" rel="noopener">' + title + '</a>')
+    photo = ('<img src="' + img + '" alt="foto">').where(img.str.startswith("http"), "")
+    return price_change, title_html, photo
+
+def is_known(urls, prev_urls):
+    """Máscara booleana: url já presente na execução anterior."""
+    if pc is not None:
+        return pc.is_in(pa.array(urls, type=pa.string()),
+                        value_set=pa.array(prev_urls, type=pa.string())).to_numpy(zero_copy_only=False)
+    return urls.isin(prev_urls).to_numpy()
+
+OUTPUT_EXTS = (".html", ".csv", ".xlsx", ".feather")
+
+_CSV_SPECIAL = r'[,"\n]'
+
+def _csv_field(s):
+    """Coluna -> texto CSV: vazio para NaN/None, aspas só quando necessário (QUOTE_MINIMAL)"""
+    s = s.astype(str).mask(s.isna(), "")
+    quoted = '"' + s.str.replace('"', '""', regex=False) + '"'
+    return s.where(~s.str.contains(_CSV_SPECIAL, regex=True), quoted)
+
+def fast_csv(df, path):
+    """Mesmo resultado do df.to_csv(index=False), mas montado por colunas e escrito numa só chamada"""
+    header = ",".join(_csv_field(pd.Series([str(c) for c in df.columns], dtype=object)))
+    cols = [_csv_field(df[c]) for c in df.columns]
+    data = header + "\n"
+    if len(df):
+        if len(cols) > 1:
+            lines = cols[0].str.cat(cols[1:], sep=",")
+        else:  # numa só coluna, linha vazia tem de ir entre aspas (regra do módulo csv)
+            lines = cols[0].mask(cols[0].eq(""), '""')
+        data += lines.str.cat(sep="\n") + "\n"
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        f.write(data)
+
+def fast_to_excel(df, path, sheet_name="Sheet1"):
+    """XLSX em modo write_only do openpyxl: as linhas são escritas em stream, sem grafo de células em memória"""
+    import openpyxl
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet(sheet_name)
+    ws.append([str(c) for c in df.columns])
+    # NaN -> None para ficar célula vazia (como o to_excel do pandas)
+    for row in df.astype(object).where(df.notna(), None).itertuples(index=False, name=None):
+        ws.append(row)
+    wb.save(path)
 
 def clean_outputs(out_dir):
     os.makedirs(out_dir, exist_ok=True)
-    for pattern in ("*.html","*.csv","*.xlsx"):
-        for f in glob.glob(os.path.join(out_dir, pattern)):
-            try: os.remove(f)
-            except Exception: pass
+    with os.scandir(out_dir) as it:
+        for e in it:
+            if e.name.endswith(OUTPUT_EXTS) and e.is_file():
+                try: os.unlink(e.path)
+                except Exception: pass
 
 def apply_config_defaults(cfg, args_namespace):
     # Map YAML keys -> argparse attributes
@@ -487,7 +705,7 @@ def main():
     ap.add_argument("--timeout", type=int, default=None)
     ap.add_argument("--retries", type=int, default=None)
     ap.add_argument("--cycles-per-source", type=int, default=None)
-    ap.add_argument("--sleep-between", type=float, default=None)
+    ap.add_argument("--sleep-between", type=float, default=None, help="Ignorado: as fontes correm em paralelo")
     ap.add_argument("--sleep-cycles", type=float, default=None)
     ap.add_argument("--cooldown-secs", type=int, default=None)
     ap.add_argument("--out-prefix", default=None)
@@ -499,7 +717,7 @@ def main():
     cfg_path = args.config if args.config else "config.yml"
     if os.path.exists(cfg_path):
         with open(cfg_path, "r", encoding="utf-8") as f:
-            cfg = yaml.safe_load(f) or {}
+            cfg = yaml.load(f, Loader=YAML_LOADER) or {}
     else:
         cfg = {}
 
@@ -514,7 +732,6 @@ def main():
     timeout = int(args.timeout) if args.timeout else 35
     retries = int(args.retries) if args.retries else 5
     cycles = int(args.cycles_per_source) if args.cycles_per_source else 5
-    sleep_between = float(args.sleep_between) if args.sleep_between else 4.0
     sleep_cycles = float(args.sleep_cycles) if args.sleep_cycles else 12.0
     cooldown_secs = int(args.cooldown_secs) if args.cooldown_secs else 900
     per_source_limit = parse_per_source_limit_map(args.per_source_limit) if args.per_source_limit else {}
@@ -522,6 +739,8 @@ def main():
     out_prefix = args.out_prefix or "data"
     site_url = args.site_url or "https://bytestay.github.io/serradaestrela/"
     rotate_priority = bool(args.rotate_priority or cfg.get("rotate_priority", False))
+    localities_re = compile_terms(localities)
+    keywords_re = compile_terms(keywords)
 
     # Rotation
     if rotate_priority and sources:
@@ -533,111 +752,146 @@ def main():
     if per_source_limit:
         quota_for = {s: int(per_source_limit.get(s, 0)) for s in sources}
     else:
-        q_each = math.ceil(limit_global / max(1, len(sources)))
+        q_each = -(-limit_global // max(1, len(sources)))  # ceil inteiro
         quota_for = {s: q_each for s in sources}
 
-    per_cycle_quota = {s: max(1, math.ceil(q for s,q in quota_for.items() and 1))}
-    # fix per-cycle quota calc
-    per_cycle_quota = {s: max(1, math.ceil(quota_for[s] / max(1, cycles))) for s in sources}
+    per_cycle_quota = {s: max(1, -(-quota_for[s] // max(1, cycles))) for s in sources}
 
     # Prepare outputs
     prev_csv = os.path.join(out_dir, f"{out_prefix}.csv")
-    df_prev = pd.read_csv(prev_csv) if os.path.exists(prev_csv) else None
+    prev_feather = os.path.join(out_dir, f"{out_prefix}.feather")
+    df_prev = None
+    if os.path.exists(prev_feather):  # binário colunar, bem mais rápido de ler que o CSV
+        try:
+            df_prev = pd.read_feather(prev_feather)
+        except Exception as e:
+            print(f"[WARN] feather not read, using CSV: {e}", file=sys.stderr)
+    if df_prev is None and os.path.exists(prev_csv):
+        df_prev = pd.read_csv(prev_csv)
     # Clean outputs
-    os.makedirs(out_dir, exist_ok=True)
-    for pattern in ("*.html","*.csv","*.xlsx"):
-        for file in glob.glob(os.path.join(out_dir, pattern)):
-            try: os.remove(file)
-            except: pass
+    clean_outputs(out_dir)
 
     # Round-robin with cooldowns
+    session = make_session(retries)  # pesquisas: sempre à rede
     all_items = []
+    seen = SeenUrls()
     per_source_collected = {s: 0 for s in sources}
     blocked_until = {s: 0 for s in sources}
 
-    for cycle in range(1, cycles+1):
-        for sname in sources:
+    # Fontes independentes (portais diferentes) correm em paralelo em cada ciclo;
+    # o dedup é online (SeenUrls nas threads): os URLs são únicos por portal, a ordem de leitura não conta.
+    with ThreadPoolExecutor(max_workers=max(1, len(sources))) as ex:
+        for cycle in range(1, cycles+1):
             now = time.time()
-            if blocked_until[sname] > now:
-                continue
-            remaining = quota_for[sname] - per_source_collected[sname]
-            if remaining <= 0:
-                continue
-            ask = min(per_cycle_quota[sname], remaining)
-            fn = SCRAPERS[sname]
-            try:
-                items = fn(
+            scheduled = []
+            for sname in sources:
+                if blocked_until[sname] > now:
+                    continue
+                remaining = quota_for[sname] - per_source_collected[sname]
+                if remaining <= 0:
+                    continue
+                ask = min(per_cycle_quota[sname], remaining)
+                fut = ex.submit(
+                    SCRAPERS[sname],
                     int(args.max_price), int(args.min_price), int(args.min_bedrooms),
-                    localities, keywords, ask, timeout, retries
+                    localities_re, keywords_re, ask, timeout, session, seen
                 )
-                if len(items) == 0:
+                scheduled.append((sname, fut))
+            for sname, fut in scheduled:
+                try:
+                    items = fut.result()
+                    if len(items) == 0:
+                        blocked_until[sname] = now + cooldown_secs
+                    else:
+                        per_source_collected[sname] += len(items)
+                        all_items.extend(items)
+                except Exception as e:
                     blocked_until[sname] = now + cooldown_secs
-                else:
-                    per_source_collected[sname] += len(items)
-                    all_items.extend(items)
-            except Exception as e:
-                blocked_until[sname] = now + cooldown_secs
-            time.sleep(sleep_between + random.uniform(0, 0.7))
-        time.sleep(sleep_cycles + random.uniform(0, 1.0))
-
-    # Dedup
-    seen, out = set(), []
-    for it in all_items:
-        key = (it.url or "").strip()
-        if not key or key in seen: continue
-        seen.add(key); out.append(it)
-
-    df = pd.DataFrame([asdict(x) for x in out], columns=["source","title","price_eur","url","location","typology","details","image_url"])
+            time.sleep(sleep_cycles + random.uniform(0, 1.0))
+
+    # Dedup já feito pelos scrapers (SeenUrls)
+    out = all_items
+    fill_images(out, make_session(retries, cache_dir=out_dir), timeout)
+
+    # Colunas diretamente (SoA) em vez de um dict por Listing
+    cols = [f.name for f in fields(Listing)]
+    df = pd.DataFrame({c: [getattr(x, c) for x in out] for c in cols}, columns=cols)
 
     # Changes vs previous + "new" detection
     ups = downs = news = 0
-    if df_prev is not None and not df.empty and "url" in df_prev.columns:
+    has_prev = df_prev is not None and not df.empty and "url" in df_prev.columns
+    if has_prev:
         prev = df_prev[["url","price_eur"]].rename(columns={"price_eur":"prev_price"})
         df = df.merge(prev, on="url", how="left")
-        def badge_and_counts(p, pp):
-            nonlocal ups, downs
-            try:
-                if pd.isna(pp): return ""
-                delta = float(p) - float(pp)
-                if abs(delta) < 1e-6: return ""
-                if delta > 0: ups += 1
-                else: downs += 1
-                arrow = "↑" if delta > 0 else "↓"
-                cls = "up" if delta > 0 else "down"
-                return f'<span class="badge {cls}">{arrow} {delta:+.0f}€</span>'
-            except Exception:
-                return ""
-        df["price_change"] = df.apply(lambda r: badge_and_counts(r["price_eur"], r["prev_price"]), axis=1)
-        prev_urls = set(df_prev["url"].astype(str).tolist())
-        news = sum(1 for u in df["url"].astype(str).tolist() if u not in prev_urls)
+    # Uma única conversão para string de url/image_url, reutilizada em isin, título e foto
+    urls_str = df["url"].astype("string")
+    image_urls_str = df["image_url"].astype("string")
+    direction = delta = None
+    if has_prev:
+        # Vetorizado: delta e contagens sobre arrays numpy (sem apply por linha)
+        # to_numeric: um preço anterior ilegível no CSV dá NaN (sem badge) em vez de rebentar
+        cur = pd.to_numeric(df["price_eur"], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+        prev_price = pd.to_numeric(df["prev_price"], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+        direction, delta = price_deltas(cur, prev_price)
+        ups, downs = int(np.count_nonzero(direction > 0)), int(np.count_nonzero(direction < 0))
+        is_new = ~is_known(urls_str, df_prev["url"].astype("string"))
+        news = int(is_new.sum())
     else:
-        df["prev_price"] = None
-        df["price_change"] = ""
+        df["prev_price"] = np.nan  # float64: sem preço anterior, sem deltas a calcular
         news = len(df)  # first run: treat as new
 
-    # Clickable title + image tag
+    # Badge + clickable title + image tag, numa só passagem
     if not df.empty:
-        df["title"] = df.apply(lambda r: f'<a href="{r["url"]}" target="_blank" rel="noopener">{r["title"]}</a>' if r.get("url") else r["title"], axis=1)
-        df["photo"] = df["image_url"].apply(lambda u: f'<img src="{u}" alt="foto">' if isinstance(u,str) and u.startswith("http") else "")
+        df["price_change"], df["title"], df["photo"] = decorate_rows(
+            direction, delta,
+            urls_str.fillna(""), image_urls_str.fillna(""), df["title"].astype("string").fillna(""))
+    else:
+        df["price_change"] = ""
+
+    # Colunas repetitivas como categóricas (códigos inteiros + poucas categorias)
+    for c in ("source", "typology", "location"):
+        if c in df.columns:
+            df[c] = df[c].astype("category")
 
     # Sort & columns
     order = ["photo","source","title","price_eur","price_change","location","typology","details","url","prev_price"]
-    df_sorted = df[ [c for c in order if c in df.columns] ].sort_values(["price_eur"], ascending=[True], na_position="last")
+    # argsort estável sobre o array de preços; NaN -> +inf garante na_position="last"
+    prices = df["price_eur"].to_numpy(dtype="float64", na_value=np.inf)
+    order_idx = np.argsort(prices, kind="stable")
+    # Seleção de colunas e reordenação de linhas num único take (sem cópia intermédia)
+    present = set(df.columns)
+    use = [c for c in order if c in present]
+    df_sorted = df.iloc[order_idx, df.columns.get_indexer(use)]
 
     total_found = len(df_sorted)
 
     # Save outputs
     csv_path = os.path.join(out_dir, f"{out_prefix}.csv")
     xlsx_path = os.path.join(out_dir, f"{out_prefix}.xlsx")
-    df_sorted.to_csv(csv_path, index=False)
-    try:
-        df_sorted.to_excel(xlsx_path, index=False)
-    except Exception as e:
-        print(f"[WARN] XLSX not written: {e}", file=sys.stderr)
-
-    # HTML page
     out_html = os.path.join(out_dir, "index.html")
-    write_html(df_sorted, out_html)
+
+    def write_feather():
+        try:
+            # cópia para máquinas (próxima execução lê daqui); o CSV fica para humanos
+            df_sorted.reset_index(drop=True).to_feather(prev_feather)
+        except Exception as e:
+            print(f"[WARN] Feather not written: {e}", file=sys.stderr)
+
+    def write_xlsx():
+        try:
+            fast_to_excel(df_sorted, xlsx_path)
+        except Exception as e:
+            print(f"[WARN] XLSX not written: {e}", file=sys.stderr)
+
+    # Escritas independentes em paralelo (I/O e serialização sobrepõem-se); erros de CSV/HTML propagam
+    with ThreadPoolExecutor(max_workers=4) as ex:
+        futs = [ex.submit(fast_csv, df_sorted, csv_path),
+                ex.submit(write_feather),
+                ex.submit(write_html, df_sorted, out_html)]
+        if os.environ.get("EMIT_XLSX", "1") == "1":
+            futs.append(ex.submit(write_xlsx))
+        for f in futs:
+            f.result()
 
     # Minimal email summary (text)
     email_txt = f"""Resumo diário — Serra da Estrela (bytestay/serradaestrela)
@@ -650,8 +904,7 @@ Novos imóveis: {news}
 Lista completa (com imagens e detalhes):
 {site_url}
 """
-    with open(os.path.join(out_dir, "email_summary.txt"), "w", encoding="utf-8") as f:
-        f.write(email_txt)
+    write_text(os.path.join(out_dir, "email_summary.txt"), email_txt)
 
     print(f"OK — {total_found} listings. Ups:{ups} Downs:{downs} New:{news}")
 if __name__ == "__main__":